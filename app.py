@@ -1,1270 +1,1279 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, request
+import orjson
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from operator import itemgetter
 import math
+from math import atan2
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import time
 import os
 
 # Create Flask app
 app = Flask(__name__)
 
-# Configure CORS with more permissive settings
-CORS(app, resources={
-    r"/*": {
-        "origins": "*",  # Allow all origins
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
 
-# Global state storage (could be replaced with a database in production)
-exercise_states = {}
+# Permissive CORS: every origin, GET/POST, and the two request headers clients send.
+# The policy is static, so fixed header values are attached instead of running a CORS extension per request
+CORS_HEADERS = (('Access-Control-Allow-Origin', '*'),)
+CORS_PREFLIGHT_HEADERS = CORS_HEADERS + (
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization'),
+)
+
+
+@app.after_request
+def add_cors_headers(response):
+    """Attach the CORS headers; Flask answers OPTIONS preflights itself, so they get the full set"""
+    response.headers.extend(CORS_PREFLIGHT_HEADERS if request.method == 'OPTIONS' else CORS_HEADERS)
+    return response
+
+# Global state storage (could be replaced with a database in production), keyed by
+# (session ID, exercise type) and kept in least-recently-used order so abandoned
+# sessions can be evicted from the front
+exercise_states = OrderedDict()
+MAX_SESSIONS = 10_000
+SESSION_TTL_NS = 3600 * 1_000_000_000  # Sessions idle for an hour are dropped
+
+# Error records wait here, unformatted, until a QueueListener writes them to stderr, which
+# keeps formatting and the write itself out of the request handler. Under the gevent worker
+# the listener is a greenlet on the same hub, so a stalled stderr can still delay requests;
+# the queue only keeps that stall from happening inline. Bounded: under an error storm
+# new records are dropped.
+error_queue = queue.Queue(maxsize=1024)
+error_listener = None  # Started on the first error, in the process that serves requests
+
+# MediaPipe Pose landmark indices used by the detectors
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+# Detector timing runs on integer nanoseconds from time.monotonic_ns()
+NS_PER_MS = 1_000_000
+REP_COOLDOWN_NS = 1000 * NS_PER_MS  # Prevent double counting
+HOLD_THRESHOLD_NS = 500 * NS_PER_MS  # Time to hold at position
+
+# Every detector indexes up to the ankles, so shorter landmark lists are rejected up front
+REQUIRED_LANDMARKS = RIGHT_ANKLE + 1
+
+# Values per landmark in the compact `landmarksFlat` payload: x, y, visibility
+LANDMARK_STRIDE = 3
+
+# Frames of knee movement and angle history the lunge detector averages over
+LUNGE_HISTORY_FRAMES = 5
+
+# Lunge decision thresholds
+LUNGE_STRAIGHT_ANGLE = 150.0  # Knee angle above which a leg counts as straight
+LUNGE_BENT_ANGLE = 110.0  # Knee angle below which a leg counts as bent
+LUNGE_STANDING_KNEE_DIFF = 0.15  # Max knee height difference while standing
+LUNGE_KNEE_DIFF = 0.2  # Min knee height difference in a lunge
+LUNGE_ANGLE_CHANGE = 20.0  # Min knee angle change across the history window
+LUNGE_MIN_MOVEMENT = 0.01  # Min average knee movement per frame
+
+# Landmarks any detector reads, in ascending order; the rest of a flat payload is skipped
+TRACKED_LANDMARKS = (NOSE, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+                     LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE)
+# Shared placeholder for the skipped landmarks (never mutated)
+UNTRACKED_LANDMARK = {}
+
+# Radians to degrees, folded once instead of dividing by pi on every angle
+RAD_TO_DEG = 180 / math.pi
+
+# Per-exercise gathers: one C-level call fetches every landmark a detector reads
+ARM_POINTS = itemgetter(LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST)
+LEG_POINTS = itemgetter(LEFT_HIP, LEFT_KNEE, LEFT_ANKLE, RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)
+PUSHUP_POINTS = itemgetter(LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST,
+                           NOSE, LEFT_HIP, RIGHT_HIP)
+TWIST_POINTS = itemgetter(LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP, LEFT_WRIST, RIGHT_WRIST)
+
+@dataclass(slots=True)
+class ExerciseState:
+    """Detector state for one session and exercise type (slots: fixed fields, no per-instance dict)"""
+    exercise_type: str
+    last_seen: int
+    rep_counter: int = 0
+    stage: str = 'down'
+    last_rep_time: int = 0
+    hold_start: int = 0
+    left_arm_stage: str = 'down'
+    right_arm_stage: str = 'down'
+    left_arm_hold_start: int = 0
+    right_arm_hold_start: int = 0
+    frame_index: int = 0
+    last_result: dict | None = None
+    # Last flat payload and the landmarks decoded from it
+    last_flat: list | None = None
+    last_landmarks: list | None = None
+    # Shoulder press wrist tracking
+    prev_left_wrist_y: float | None = None
+    prev_right_wrist_y: float | None = None
+    # Lunge knee tracking (last few frames)
+    prev_left_knee_y: float | None = None
+    prev_right_knee_y: float | None = None
+    movement_history: deque = field(default_factory=lambda: deque(maxlen=LUNGE_HISTORY_FRAMES))
+    angle_history: deque = field(default_factory=lambda: deque(maxlen=LUNGE_HISTORY_FRAMES))
+    # Russian twist
+    twist_state: str = 'center'
+    twist_direction: str = 'none'
+    left_complete: bool = False
+    right_complete: bool = False
+    prev_wrist_x: float | None = None
+
+
+# Serialized once: malformed bodies are rejected without building an error payload per request
+BAD_REQUEST_BODY = orjson.dumps({'error': 'Malformed request body'})
+
+
+def json_response(payload, status=200):
+    """Serialize with orjson (C encoder, insertion-ordered keys) instead of Flask's jsonify"""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
+def bad_request():
+    """400 for a body that is not a landmarks payload, from prebuilt bytes"""
+    return app.response_class(BAD_REQUEST_BODY, status=400, mimetype='application/json')
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that leaves records unformatted and drops them when the queue is full"""
+
+    def prepare(self, record):
+        # The listener formats the record; nothing is built on the request path
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+# Only warnings and errors are logged; lines go to stderr unadorned, as before
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+logger.propagate = False
+logger.addHandler(DroppingQueueHandler(error_queue))
+
+
+def start_error_listener():
+    """Start writing queued error records to stderr; stopping at exit flushes what is left"""
+    global error_listener
+    stderr_handler = logging.StreamHandler()
+    stderr_handler.setFormatter(logging.Formatter('%(message)s'))
+    error_listener = QueueListener(error_queue, stderr_handler)
+    error_listener.start()
+    atexit.register(error_listener.stop)
+
+
+def log_error(message, *args):
+    """Queue an error message and its %-style arguments for the error listener"""
+    if error_listener is None:
+        start_error_listener()
+    logger.error(message, *args)
+
 
 @app.route('/')
 def index():
     """Simple route for the root URL to verify the API is running"""
-    return jsonify({
+    return json_response({
         'status': 'online',
         'message': 'Exercise Counter API is running',
         'endpoints': {
-            '/process_landmarks': 'POST - Process exercise landmarks from MediaPipe'
+            '/process_landmarks': 'POST - Process exercise landmarks from MediaPipe (one frame, or a batch under "frames")',
+            '/process_batch': 'POST - Process a batch of frames under "frames" and return one result per frame'
         }
     })
 
 @app.route('/process_landmarks', methods=['POST'])
 def process_landmarks():
-    """Process landmarks from the frontend and return exercise data"""
+    """Process landmarks from the frontend and return exercise data for the newest frame"""
+    return analyse_frames(per_frame=False)
+
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """Process a batch of frames from the frontend and return exercise data for every frame"""
+    return analyse_frames(per_frame=True)
+
+
+def analyse_frames(per_frame):
+    """Run the session's detector over the posted frames; shared by both landmark endpoints"""
     try:
-        data = request.json
-        landmarks = data.get('landmarks', [])
+        try:
+            data = orjson.loads(request.get_data(cache=False))  # Read once; no need to keep a copy of the body
+        except orjson.JSONDecodeError:
+            return bad_request()
+        if not isinstance(data, dict):
+            return bad_request()
+        # Clients may queue frames while a request is in flight and send them together;
+        # the batch endpoint always expects them under "frames"
+        frames = data.get('frames') if per_frame else data.get('frames') or [data]
+        if not isinstance(frames, list) or not frames or not all(isinstance(frame, dict) for frame in frames):
+            return bad_request()
         exercise_type = data.get('exerciseType', 'bicepCurl')
-        session_id = data.get('sessionId', request.remote_addr)  # Use provided session ID or fallback to IP
-        
-        # Generate a unique client key combining session ID and exercise type
-        client_key = f"{session_id}_{exercise_type}"
-        
-        # Initialize state for this client if not exists or if exercise type changed
-        if client_key not in exercise_states:
-            exercise_states[client_key] = {
-                'repCounter': 0,
-                'stage': 'down',
-                'lastRepTime': 0,
-                'holdStart': 0,
-                'leftArmStage': 'down',
-                'rightArmStage': 'down',
-                'leftArmHoldStart': 0,
-                'rightArmHoldStart': 0,
-                'exerciseType': exercise_type
-            }
+        # Use provided session ID or fallback to IP (only touch the request proxy when needed)
+        session_id = data['sessionId'] if 'sessionId' in data else request.remote_addr
+        # Both fields key dicts below; a JSON object or array would be unhashable, so
+        # non-strings are keyed by their text as the old formatted-string key did
+        if not isinstance(exercise_type, str):
+            exercise_type = str(exercise_type)
+        if not isinstance(session_id, str):
+            session_id = str(session_id)
         
-        client_state = exercise_states[client_key]
-        current_time = int(time.time() * 1000)  # Current time in milliseconds
-        rep_cooldown = 1000  # Prevent double counting
-        hold_threshold = 500  # Time to hold at position
-        
-        # Process landmarks based on exercise type
-        result = {
-            'repCounter': client_state['repCounter'],
-            'stage': client_state['stage'],
-            'feedback': ''
-        }
+        current_time = time.monotonic_ns()  # Monotonic, so wall-clock adjustments cannot skew timing
+
+        # One state per session and exercise type; a tuple key skips formatting a string per request
+        client_key = (session_id, exercise_type)
+        client_state = exercise_states.get(client_key)
+        if client_state is None:
+            client_state = exercise_states[client_key] = ExerciseState(exercise_type, current_time)
+            evict_sessions(current_time)
+        else:
+            exercise_states.move_to_end(client_key)
+            client_state.last_seen = current_time
+
+        rep_cooldown = REP_COOLDOWN_NS
+        hold_threshold = HOLD_THRESHOLD_NS
         
         # Process different exercise types
-        if exercise_type == 'bicepCurl':
-            result = process_bicep_curl(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'squat':
-            result = process_squat(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'pushup':
-            result = process_pushup(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'shoulderPress':
-            result = process_shoulder_press(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'tricepExtension':
-            result = process_tricep_extension(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'lunge':
-            result = process_lunge(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        elif exercise_type == 'russianTwist':
-            result = process_russian_twist(landmarks, client_state, current_time, rep_cooldown, hold_threshold)
-        
-        # Update client state with the new values
-        exercise_states[client_key] = client_state
-        
-        return jsonify(result)
+        handler = EXERCISE_HANDLERS.get(exercise_type)
+        if handler is None:
+            # Unknown exercise type: echo the stored state without processing
+            result = {
+                'repCounter': client_state.rep_counter,
+                'stage': client_state.stage,
+                'feedback': ''
+            }
+            return json_response([result] * len(frames) if per_frame else result)
+
+        # Replay the frames in order under one request. Each frame is placed back in
+        # time by its age relative to the newest frame, so hold and cooldown timing
+        # still see the gaps between frames.
+        #
+        # With ?frameStep=N only every Nth frame of the session is analysed; the frames
+        # in between reuse the last result. Holds and cooldowns span many frames, so small
+        # steps leave the hold-based detectors' counts intact; defaults to every frame.
+        frame_step = max(request.args.get('frameStep', 1, type=int), 1)
+        latest_timestamp = frame_timestamp(frames[-1], 0)
+        results = []
+        latest_feedback = ''
+        for frame in frames:
+            client_state.frame_index += 1
+            if client_state.frame_index % frame_step and client_state.last_result is not None:
+                result = client_state.last_result
+            else:
+                # Client timestamps are in milliseconds
+                frame_age = max(latest_timestamp - frame_timestamp(frame, latest_timestamp), 0) * NS_PER_MS
+                result = run_detector(handler, frame_landmarks(frame, client_state), client_state, current_time - frame_age, rep_cooldown, hold_threshold)
+                client_state.last_result = result
+            if per_frame:
+                results.append(result)
+            elif result.get('feedback'):
+                latest_feedback = result['feedback']
+
+        # No write-back needed: the handlers mutated client_state, which is the
+        # same ExerciseState object stored in exercise_states, in place
+        angle_format = data.get('angleFormat')
+        if per_frame:
+            return json_response([shape_result(result, angle_format) for result in results])
+        # Only the newest frame's result is returned; if it has no feedback, carry the latest an
+        # earlier frame in the batch produced (such as a rep message), as the client would have
+        # kept showing it had the frames been sent one by one
+        if latest_feedback and not result.get('feedback'):
+            result = dict(result, feedback=latest_feedback)
+        return json_response(shape_result(result, angle_format))
     
     except Exception as e:
-        print(f"Error processing landmarks: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        log_error("Error processing landmarks: %s", e)
+        return json_response({'error': str(e)}, 500)
+
+
+def frame_timestamp(frame, default):
+    """A frame's client timestamp in milliseconds; a missing or non-numeric one counts as `default`"""
+    timestamp = frame.get('timestamp', default)
+    return timestamp if isinstance(timestamp, (int, float)) else default
+
+
+def shape_result(result, angle_format):
+    """Detector result with its angles in the format the client asked for"""
+    # Detectors keep angles as (value, x, y) tuples; shape them for the client here.
+    # 'columns' gives parallel lists, 'tuples' sends {'L': [value, x, y]} as is, 'none' leaves
+    # them out for clients that draw no overlay, and the default is the original nested dicts
+    # (always a new dict, since the result may be the cached lastResult)
+    if angle_format == 'none':
+        return {key: value for key, value in result.items() if key != 'angles'}
+    if angle_format != 'tuples' and 'angles' in result:
+        shape_angles = columnar_angles if angle_format == 'columns' else nested_angles
+        return dict(result, angles=shape_angles(result['angles']))
+    return result
+
+
+def evict_sessions(now):
+    """Drop sessions idle past SESSION_TTL_NS, then the least recently used ones beyond MAX_SESSIONS"""
+    # Entries are kept in last-seen order, so idle ones are always at the front
+    while exercise_states:
+        oldest = next(iter(exercise_states.values()))
+        if now - oldest.last_seen <= SESSION_TTL_NS:
+            break
+        exercise_states.popitem(last=False)
+    while len(exercise_states) > MAX_SESSIONS:
+        exercise_states.popitem(last=False)
+
+
+def run_detector(handler, landmarks, state, current_time, rep_cooldown, hold_threshold):
+    """Run one detector on a frame's landmarks; bad input becomes an error result, not a 500"""
+    if not isinstance(landmarks, list):
+        return detector_error(state, "landmarks must be a list")
+    if len(landmarks) < REQUIRED_LANDMARKS:
+        return detector_error(state, f"expected at least {REQUIRED_LANDMARKS} landmarks, got {len(landmarks)}")
+
+    # One guard for all detectors instead of a try/except wrapped around each body
+    try:
+        return handler(landmarks, state, current_time, rep_cooldown, hold_threshold)
+    except Exception as e:
+        log_error("Error in %s detection: %s", state.exercise_type, e)
+        return detector_error(state, str(e))
+
+
+def detector_error(state, message):
+    """Result returned when a frame cannot be analysed"""
+    return {
+        'repCounter': state.rep_counter,
+        # Russian twists report their own twist_state as the stage
+        'stage': state.twist_state if state.exercise_type == 'russianTwist' else state.stage,
+        'feedback': f"Error: {message}",
+        'angles': {}
+    }
+
+
+def frame_landmarks(frame, state):
+    """Landmark dicts for one frame, sent either as `landmarksFlat` or as `landmarks`"""
+    if 'landmarksFlat' in frame:
+        flat = frame['landmarksFlat']
+        if not isinstance(flat, list):
+            return flat  # Rejected by run_detector
+        # A still subject can produce identical frames; reuse the dicts built for the last one.
+        # Only the decoding is skipped: the detector still runs, so holds keep timing.
+        if flat == state.last_flat:
+            return state.last_landmarks
+        landmarks = unflatten_landmarks(flat)
+        state.last_flat = flat
+        state.last_landmarks = landmarks
+        return landmarks
+    return frame.get('landmarks', [])
+
+
+def unflatten_landmarks(flat):
+    """Expand a flat [x0, y0, vis0, x1, y1, vis1, ...] payload into landmark dicts
+
+    A null coordinate marks a value MediaPipe did not report; it is left out of
+    the landmark dict so the per-exercise visibility checks still see it as missing.
+    Only TRACKED_LANDMARKS get a dict of their own; no detector reads the others.
+    """
+    count = len(flat) // LANDMARK_STRIDE
+    landmarks = [UNTRACKED_LANDMARK] * count
+    for index in TRACKED_LANDMARKS:
+        if index >= count:
+            break
+        i = index * LANDMARK_STRIDE
+        x, y, visibility = flat[i:i + LANDMARK_STRIDE]
+        if x is not None and y is not None and visibility is not None:
+            landmarks[index] = {'x': x, 'y': y, 'visibility': visibility}
+            continue
+        point = {}
+        if x is not None:
+            point['x'] = x
+        if y is not None:
+            point['y'] = y
+        if visibility is not None:
+            point['visibility'] = visibility
+        landmarks[index] = point
+    return landmarks
+
+
+def angle_between(ax, ay, bx, by, cx, cy):
+    """Angle ABC in degrees from plain coordinates (the per-frame hot path)"""
+    # Vectors from pointB to pointA and pointB to pointC, kept in locals
+    bax = ax - bx
+    bay = ay - by
+    bcx = cx - bx
+    bcy = cy - by
+
+    # atan2(|cross|, dot) needs no magnitudes, no clamp and stays accurate near 0 and 180 degrees.
+    # A zero-length vector must read as 0 degrees, but its dot product can come out as -0.0 and
+    # atan2(0.0, -0.0) is 180; adding 0.0 turns -0.0 into 0.0 and leaves every other value alone
+    return atan2(abs(bax * bcy - bay * bcx), bax * bcx + bay * bcy + 0.0) * RAD_TO_DEG
 
 
 def calculate_angle(a, b, c):
     """Calculate angle between three points"""
-    try:
-        # Convert to vector from pointB to pointA and pointB to pointC
-        vector_ba = {
-            'x': a['x'] - b['x'],
-            'y': a['y'] - b['y']
-        }
+    return angle_between(a['x'], a['y'], b['x'], b['y'], c['x'], c['y'])
 
-        vector_bc = {
-            'x': c['x'] - b['x'],
-            'y': c['y'] - b['y']
-        }
 
-        # Calculate dot product
-        dot_product = vector_ba['x'] * vector_bc['x'] + vector_ba['y'] * vector_bc['y']
+def has_xy(point):
+    """True when a landmark carries both coordinates"""
+    return 'x' in point and 'y' in point
 
-        # Calculate magnitudes
-        magnitude_ba = math.sqrt(vector_ba['x']**2 + vector_ba['y']**2)
-        magnitude_bc = math.sqrt(vector_bc['x']**2 + vector_bc['y']**2)
 
-        # Calculate angle in radians (handle division by zero or invalid inputs)
-        if magnitude_ba == 0 or magnitude_bc == 0:
-            return 0
-            
-        cos_angle = dot_product / (magnitude_ba * magnitude_bc)
-        
-        # Handle floating point errors that could make cos_angle outside [-1, 1]
-        cos_angle = max(min(cos_angle, 1.0), -1.0)
-        
-        angle_rad = math.acos(cos_angle)
+def average_angle(angles, left_angle, right_angle, left_point, right_point, label_offset_y=0.0):
+    """Average of whichever side angles are present; with both, also records 'Avg' between the two joints"""
+    if left_angle is None:
+        return right_angle
+    if right_angle is None:
+        return left_angle
+    avg_angle = (left_angle + right_angle) * 0.5
+    # Position between both joints
+    mid_x = (left_point['x'] + right_point['x']) * 0.5
+    mid_y = (left_point['y'] + right_point['y']) * 0.5
+    angles['Avg'] = (avg_angle, mid_x, mid_y + label_offset_y)
+    return avg_angle
 
-        # Convert to degrees
-        angle_deg = angle_rad * (180 / math.pi)
-        
-        return angle_deg
-    
-    except Exception as e:
-        print(f"Error calculating angle: {str(e)}")
-        return 0
 
+def nested_angles(angles):
+    """Expand (value, x, y) entries to the original {'value', 'position': {'x', 'y'}} dicts"""
+    return {name: {'value': value, 'position': {'x': x, 'y': y}} for name, (value, x, y) in angles.items()}
 
-def process_bicep_curl(landmarks, state, current_time, rep_cooldown, hold_threshold):
-    """Process landmarks for bicep curl exercise"""
-    try:
-        # Left arm
-        left_shoulder = landmarks[11]
-        left_elbow = landmarks[13]
-        left_wrist = landmarks[15]
-
-        # Right arm
-        right_shoulder = landmarks[12]
-        right_elbow = landmarks[14]
-        right_wrist = landmarks[16]
-
-        # Track state for both arms
-        left_angle = None
-        right_angle = None
-        left_curl_detected = False
-        right_curl_detected = False
-        angles = {}
-
-        # Calculate and store left arm angle
-        if all(k in left_shoulder for k in ['x', 'y']) and all(k in left_elbow for k in ['x', 'y']) and all(k in left_wrist for k in ['x', 'y']):
-            left_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-            # Store angle with position data
-            angles['L'] = {
-                'value': left_angle,
-                'position': {
-                    'x': left_elbow['x'],
-                    'y': left_elbow['y']
-                }
-            }
 
-            # Detect left arm curl
-            if left_angle > 140:
-                state['leftArmStage'] = "down"
-                state['leftArmHoldStart'] = current_time
-            if left_angle < 50 and state['leftArmStage'] == "down":
-                if current_time - state['leftArmHoldStart'] > hold_threshold:
-                    left_curl_detected = True
-                    state['leftArmStage'] = "up"
-
-        # Calculate and store right arm angle
-        if all(k in right_shoulder for k in ['x', 'y']) and all(k in right_elbow for k in ['x', 'y']) and all(k in right_wrist for k in ['x', 'y']):
-            right_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-            # Store angle with position data
-            angles['R'] = {
-                'value': right_angle,
-                'position': {
-                    'x': right_elbow['x'],
-                    'y': right_elbow['y']
-                }
-            }
+def columnar_angles(angles):
+    """Repack an `angles` dict as parallel name/value/position columns (one list each)"""
+    entries = angles.values()
+    return {
+        'names': list(angles),
+        'values': [value for value, _, _ in entries],
+        'positions': [[x, y] for _, x, y in entries]
+    }
 
-            # Detect right arm curl
-            if right_angle > 140:
-                state['rightArmStage'] = "down"
-                state['rightArmHoldStart'] = current_time
-            if right_angle < 50 and state['rightArmStage'] == "down":
-                if current_time - state['rightArmHoldStart'] > hold_threshold:
-                    right_curl_detected = True
-                    state['rightArmStage'] = "up"
-
-        # Count rep if either arm completes a curl and enough time has passed since last rep
-        if (left_curl_detected or right_curl_detected) and current_time - state['lastRepTime'] > rep_cooldown:
-            state['repCounter'] += 1
-            state['lastRepTime'] = current_time
-            
-            # Generate feedback
-            feedback = "Good rep!"
-            if left_curl_detected and right_curl_detected:
-                feedback = "Great form! Both arms curled."
-            elif left_curl_detected:
-                feedback = "Left arm curl detected."
-            elif right_curl_detected:
-                feedback = "Right arm curl detected."
-
-            return {
-                'repCounter': state['repCounter'],
-                'stage': 'up' if left_curl_detected or right_curl_detected else 'down',
-                'feedback': feedback,
-                'angles': angles
-            }
 
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['leftArmStage'] if left_curl_detected else state['rightArmStage'],
-            'angles': angles
-        }
+def make_lane_step(rearm_angle, done_angle):
+    """Specialize the one-arm stage machine for an exercise's two thresholds.
+
+    Returns step(angle, stage, hold_start, current_time, hold_threshold) -> (stage, hold start, rep completed).
+    Crossing rearm_angle resets the lane to "down"; reaching done_angle from "down" after the
+    hold completes a rep. The direction is resolved here, once, so each step only does float compares.
+    """
+    if rearm_angle > done_angle:
+        # Curls: a straight arm re-arms the lane, a bent arm completes it
+        def lane_step(angle, stage, hold_start, current_time, hold_threshold):
+            if angle > rearm_angle:
+                stage = "down"
+                hold_start = current_time
+            done = angle < done_angle and stage == "down" and current_time - hold_start > hold_threshold
+            if done:
+                stage = "up"
+            return stage, hold_start, done
+    else:
+        # Extensions: a bent arm re-arms the lane, a straight arm completes it
+        def lane_step(angle, stage, hold_start, current_time, hold_threshold):
+            if angle < rearm_angle:
+                stage = "down"
+                hold_start = current_time
+            done = angle > done_angle and stage == "down" and current_time - hold_start > hold_threshold
+            if done:
+                stage = "up"
+            return stage, hold_start, done
+    return lane_step
+
+
+curl_lane_step = make_lane_step(140.0, 50.0)
+extension_lane_step = make_lane_step(90.0, 150.0)
+
+
+def process_bicep_curl(landmarks, state, current_time, rep_cooldown, hold_threshold):
+    """Process landmarks for bicep curl exercise"""
+    # Fetch both arms up front so a short landmark list fails before any state is touched
+    left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist = ARM_POINTS(landmarks)
+
+    left_curl_detected = False
+    right_curl_detected = False
+    angles = {}
+
+    # Left arm
+    if has_xy(left_shoulder) and has_xy(left_elbow) and has_xy(left_wrist):
+        left_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
+        # Store angle with position data
+        angles['L'] = (left_angle, left_elbow['x'], left_elbow['y'])
+
+        state.left_arm_stage, state.left_arm_hold_start, left_curl_detected = curl_lane_step(
+            left_angle, state.left_arm_stage, state.left_arm_hold_start, current_time, hold_threshold)
+
+    # Right arm
+    if has_xy(right_shoulder) and has_xy(right_elbow) and has_xy(right_wrist):
+        right_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
+        # Store angle with position data
+        angles['R'] = (right_angle, right_elbow['x'], right_elbow['y'])
+
+        state.right_arm_stage, state.right_arm_hold_start, right_curl_detected = curl_lane_step(
+            right_angle, state.right_arm_stage, state.right_arm_hold_start, current_time, hold_threshold)
+
+    # Count rep if either arm completes a curl and enough time has passed since last rep
+    if (left_curl_detected or right_curl_detected) and current_time - state.last_rep_time > rep_cooldown:
+        state.rep_counter += 1
+        state.last_rep_time = current_time
         
-    except Exception as e:
-        print(f"Error in bicep curl detection: {str(e)}")
+        # Generate feedback
+        feedback = "Good rep!"
+        if left_curl_detected and right_curl_detected:
+            feedback = "Great form! Both arms curled."
+        elif left_curl_detected:
+            feedback = "Left arm curl detected."
+        elif right_curl_detected:
+            feedback = "Right arm curl detected."
+
         return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': f"Error: {str(e)}"
+            'repCounter': state.rep_counter,
+            'stage': 'up' if left_curl_detected or right_curl_detected else 'down',
+            'feedback': feedback,
+            'angles': angles
         }
 
+    return {
+        'repCounter': state.rep_counter,
+        'stage': state.left_arm_stage if left_curl_detected else state.right_arm_stage,
+        'angles': angles
+    }
+
+
+def squat_step(knee_angle, hip_height, stage, hold_start, last_rep_time, current_time, rep_cooldown, hold_threshold):
+    """Squat stage machine on plain numbers; returns (stage, hold start, rep counted, feedback)"""
+    feedback = ""
+    rep_counted = False
+
+    # Standing position detection (straight legs and higher hip position)
+    # Keep the standing position criteria similar to original
+    if knee_angle > 160.0 and hip_height < 0.6:
+        stage = "up"
+        hold_start = current_time
+        feedback = "Standing position"
+
+    # MODIFIED: Less deep squat position detection
+    # Original required avg_knee_angle < 120 and hip_height > 0.65
+    # Now we make it easier by:
+    # 1. Increasing the knee angle threshold (less bend required)
+    # 2. Reducing the hip height requirement (less depth required)
+    if knee_angle < 125.0 and hip_height > 0.65 and stage == "up":
+        if current_time - hold_start > hold_threshold and current_time - last_rep_time > rep_cooldown:
+            stage = "down"
+            rep_counted = True
+            feedback = "Rep complete!"
+        else:
+            feedback = "Squatting"
+
+    return stage, hold_start, rep_counted, feedback
+
 
 def process_squat(landmarks, state, current_time, rep_cooldown, hold_threshold):
     """Process landmarks for squat exercise with reduced depth requirement"""
-    try:
-        # Get landmarks for both legs
-        left_hip = landmarks[23]
-        left_knee = landmarks[25]
-        left_ankle = landmarks[27]
-        right_hip = landmarks[24]
-        right_knee = landmarks[26]
-        right_ankle = landmarks[28]
-
-        # Variables to store angles and status
-        left_knee_angle = None
-        right_knee_angle = None
-        avg_knee_angle = None
-        hip_height = None
-        angles = {}
-        feedback = ""
-
-        # Calculate left knee angle if landmarks are visible
-        if all(k in left_hip for k in ['x', 'y']) and all(k in left_knee for k in ['x', 'y']) and all(k in left_ankle for k in ['x', 'y']):
-            left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-            angles['L'] = {
-                'value': left_knee_angle,
-                'position': {
-                    'x': left_knee['x'] + 0.05,  # Offset a bit to the right
-                    'y': left_knee['y']
-                }
-            }
+    # Get landmarks for both legs
+    left_hip, left_knee, left_ankle, right_hip, right_knee, right_ankle = LEG_POINTS(landmarks)
+
+    # Which landmarks carry both coordinates, checked once per frame
+    left_hip_xy = has_xy(left_hip)
+    left_knee_xy = has_xy(left_knee)
+    left_ankle_xy = has_xy(left_ankle)
+    right_hip_xy = has_xy(right_hip)
+    right_knee_xy = has_xy(right_knee)
+    right_ankle_xy = has_xy(right_ankle)
+
+    # Variables to store angles and status
+    left_knee_angle = None
+    right_knee_angle = None
+    hip_height = None
+    angles = {}
+    feedback = ""
+
+    # Calculate left knee angle if landmarks are visible
+    if left_hip_xy and left_knee_xy and left_ankle_xy:
+        left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
+        angles['L'] = (left_knee_angle, left_knee['x'] + 0.05, left_knee['y'])  # Offset a bit to the right
+
+    # Calculate right knee angle if landmarks are visible
+    if right_hip_xy and right_knee_xy and right_ankle_xy:
+        right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
+        angles['R'] = (right_knee_angle, right_knee['x'] + 0.05, right_knee['y'])  # Offset a bit to the right
+
+    # Average knee angle from whichever knees are available, label offset upward
+    avg_knee_angle = average_angle(angles, left_knee_angle, right_knee_angle, left_knee, right_knee, -0.05)
+
+    # Calculate hip height (normalized to image height)
+    if left_hip_xy and right_hip_xy:
+        hip_height = (left_hip['y'] + right_hip['y']) * 0.5
+        mid_x = (left_hip['x'] + right_hip['x']) * 0.5
+        angles['Hip'] = (hip_height * 100, mid_x, hip_height - 0.05)  # Percentage, label offset upward
+
+    # Process squat detection with REDUCED DEPTH REQUIREMENT
+    if avg_knee_angle is not None and hip_height is not None:
+        state.stage, state.hold_start, rep_counted, feedback = squat_step(
+            avg_knee_angle, hip_height, state.stage, state.hold_start, state.last_rep_time,
+            current_time, rep_cooldown, hold_threshold)
+        if rep_counted:
+            state.rep_counter += 1
+            state.last_rep_time = current_time
+
+    return {
+        'repCounter': state.rep_counter,
+        'stage': state.stage,
+        'feedback': feedback,
+        'angles': angles,
+        'status': "Standing" if state.stage == "up" else "Squatting"  # Include status for UI display
+    }
 
-        # Calculate right knee angle if landmarks are visible
-        if all(k in right_hip for k in ['x', 'y']) and all(k in right_knee for k in ['x', 'y']) and all(k in right_ankle for k in ['x', 'y']):
-            right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-            angles['R'] = {
-                'value': right_knee_angle,
-                'position': {
-                    'x': right_knee['x'] + 0.05,  # Offset a bit to the right
-                    'y': right_knee['y']
-                }
-            }
 
-        # Calculate average knee angle if both are available
-        if left_knee_angle is not None and right_knee_angle is not None:
-            avg_knee_angle = (left_knee_angle + right_knee_angle) / 2
-            # Position between both knees
-            mid_x = (left_knee['x'] + right_knee['x']) / 2
-            mid_y = (left_knee['y'] + right_knee['y']) / 2
-            angles['Avg'] = {
-                'value': avg_knee_angle,
-                'position': {
-                    'x': mid_x,
-                    'y': mid_y - 0.05  # Offset upward
-                }
-            }
-        elif left_knee_angle is not None:
-            avg_knee_angle = left_knee_angle
-        elif right_knee_angle is not None:
-            avg_knee_angle = right_knee_angle
-
-        # Calculate hip height (normalized to image height)
-        if all(k in left_hip for k in ['x', 'y']) and all(k in right_hip for k in ['x', 'y']):
-            hip_height = (left_hip['y'] + right_hip['y']) / 2
-            mid_x = (left_hip['x'] + right_hip['x']) / 2
-            angles['Hip'] = {
-                'value': hip_height * 100,  # Convert to percentage
-                'position': {
-                    'x': mid_x,
-                    'y': hip_height - 0.05  # Offset upward
-                }
-            }
+def process_pushup(landmarks, state, current_time, rep_cooldown, hold_threshold):
+    """Process landmarks for pushup exercise using similar logic to the JavaScript implementation"""
+    # Get landmarks for both arms and shoulders, plus body points for height/position tracking
+    (left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist,
+     nose, left_hip, right_hip) = PUSHUP_POINTS(landmarks)
+
+    # Which landmarks carry both coordinates, checked once per frame
+    left_shoulder_xy = has_xy(left_shoulder)
+    left_elbow_xy = has_xy(left_elbow)
+    left_wrist_xy = has_xy(left_wrist)
+    right_shoulder_xy = has_xy(right_shoulder)
+    right_elbow_xy = has_xy(right_elbow)
+    right_wrist_xy = has_xy(right_wrist)
+    left_hip_xy = has_xy(left_hip)
+    right_hip_xy = has_xy(right_hip)
+
+    # Variables to store angles and status
+    left_elbow_angle = None
+    right_elbow_angle = None
+    body_height = None
+    body_alignment = None
+    angles = {}
+    feedback = ""
+    warnings = []
+
+    # Calculate left arm angle if landmarks are visible
+    if left_shoulder_xy and left_elbow_xy and left_wrist_xy:
+        left_elbow_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
+        angles['L'] = (left_elbow_angle, left_elbow['x'] + 0.05, left_elbow['y'])  # Offset a bit to the right like in JS
+
+    # Calculate right arm angle if landmarks are visible
+    if right_shoulder_xy and right_elbow_xy and right_wrist_xy:
+        right_elbow_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
+        angles['R'] = (right_elbow_angle, right_elbow['x'] + 0.05, right_elbow['y'])  # Offset a bit to the right like in JS
+
+    # Average elbow angle from whichever arms are available, label offset upward like in JS
+    avg_elbow_angle = average_angle(angles, left_elbow_angle, right_elbow_angle, left_elbow, right_elbow, -0.05)
+
+    # Calculate body height (y-coordinate of shoulders); the shoulder midpoint is reused for alignment
+    if left_shoulder_xy and right_shoulder_xy:
+        shoulder_mid_x = (left_shoulder['x'] + right_shoulder['x']) * 0.5
+        shoulder_mid_y = body_height = (left_shoulder['y'] + right_shoulder['y']) * 0.5
+        angles['Height'] = (body_height * 100, shoulder_mid_x, body_height - 0.05)  # Percentage, label offset upward like in JS
+
+    # Check body alignment (straight back)
+    if left_shoulder_xy and right_shoulder_xy and left_hip_xy and right_hip_xy:
+        
+        hip_mid_x = (left_hip['x'] + right_hip['x']) * 0.5
+        hip_mid_y = (left_hip['y'] + right_hip['y']) * 0.5
 
-        # Process squat detection with REDUCED DEPTH REQUIREMENT
-        if avg_knee_angle is not None and hip_height is not None:
-            # Standing position detection (straight legs and higher hip position)
-            # Keep the standing position criteria similar to original
-            if avg_knee_angle > 160 and hip_height < 0.6:
-                state['stage'] = "up"
-                state['holdStart'] = current_time
-                feedback = "Standing position"
-            
-            # MODIFIED: Less deep squat position detection
-            # Original required avg_knee_angle < 120 and hip_height > 0.65
-            # Now we make it easier by:
-            # 1. Increasing the knee angle threshold (less bend required)
-            # 2. Reducing the hip height requirement (less depth required)
-            if avg_knee_angle < 125 and hip_height > 0.65 and state['stage'] == "up":
-                if current_time - state['holdStart'] > hold_threshold and current_time - state['lastRepTime'] > rep_cooldown:
-                    state['stage'] = "down"
-                    state['repCounter'] += 1
-                    state['lastRepTime'] = current_time
-                    feedback = "Rep complete!"
-                else:
-                    feedback = "Squatting"
+        # Calculate angle between shoulders and hips to check for body alignment
+        # Angle from horizontal in the 0-90 degree range (0 = perfect horizontal alignment);
+        # taking both components' magnitudes folds the quadrants without a wrap branch
+        alignment_angle = atan2(abs(hip_mid_y - shoulder_mid_y), abs(hip_mid_x - shoulder_mid_x)) * RAD_TO_DEG
 
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': feedback,
-            'angles': angles,
-            'status': "Standing" if state['stage'] == "up" else "Squatting"  # Include status for UI display
-        }
+        body_alignment = alignment_angle
+        angles['Align'] = (body_alignment, hip_mid_x, hip_mid_y + 0.05)  # Offset downward like in JS
         
-    except Exception as e:
-        print(f"Error in squat detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': f"Error: {str(e)}",
-            'angles': {}
-        }
+        # Check alignment and add warning if needed
+        if body_alignment > 15.0:
+            warnings.append("Keep body straight!")
+
+    # Process pushup detection using elbow angles, body height, and alignment
+    status = ""
+    if avg_elbow_angle is not None and body_height is not None:
+        # Up position detection (straight arms, higher body position)
+        if avg_elbow_angle > 160.0 and body_height < 0.7:
+            state.stage = "up"
+            state.hold_start = current_time
+            status = "Up Position"
+
+        # Down position detection (bent arms, lower body position)
+        if avg_elbow_angle < 90.0 and state.stage == "up":
+            if current_time - state.hold_start > hold_threshold and current_time - state.last_rep_time > rep_cooldown:
+                state.stage = "down"
+                state.rep_counter += 1
+                state.last_rep_time = current_time
+                status = "Rep Complete!"
+                feedback = "Rep complete! Good pushup."
+            else:
+                status = "Down Position"
+                feedback = "Down position - hold briefly"
+
+    return {
+        'repCounter': state.rep_counter,
+        'stage': state.stage,
+        'feedback': feedback,
+        'angles': angles,
+        'status': status,
+        'warnings': warnings
+    }
 
-def process_pushup(landmarks, state, current_time, rep_cooldown, hold_threshold):
-    """Process landmarks for pushup exercise using similar logic to the JavaScript implementation"""
-    try:
-        # Get landmarks for both arms and shoulders
-        left_shoulder = landmarks[11]
-        left_elbow = landmarks[13]
-        left_wrist = landmarks[15]
-        right_shoulder = landmarks[12]
-        right_elbow = landmarks[14]
-        right_wrist = landmarks[16]
-
-        # Additional body points for height/position tracking
-        nose = landmarks[0]
-        left_hip = landmarks[23]
-        right_hip = landmarks[24]
-
-        # Variables to store angles and status
-        left_elbow_angle = None
-        right_elbow_angle = None
-        avg_elbow_angle = None
-        body_height = None
-        body_alignment = None
-        angles = {}
-        feedback = ""
-        warnings = []
-
-        # Calculate left arm angle if landmarks are visible
-        if all(k in left_shoulder for k in ['x', 'y']) and all(k in left_elbow for k in ['x', 'y']) and all(k in left_wrist for k in ['x', 'y']):
-            left_elbow_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-            angles['L'] = {
-                'value': left_elbow_angle,
-                'position': {
-                    'x': left_elbow['x'] + 0.05,  # Offset a bit to the right like in JS
-                    'y': left_elbow['y']
-                }
-            }
 
-        # Calculate right arm angle if landmarks are visible
-        if all(k in right_shoulder for k in ['x', 'y']) and all(k in right_elbow for k in ['x', 'y']) and all(k in right_wrist for k in ['x', 'y']):
-            right_elbow_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-            angles['R'] = {
-                'value': right_elbow_angle,
-                'position': {
-                    'x': right_elbow['x'] + 0.05,  # Offset a bit to the right like in JS
-                    'y': right_elbow['y']
-                }
-            }
+def press_arm_features(angles, angle_key, wrist_key, shoulder, elbow, wrist):
+    """One arm's shoulder press features: (elbow angle, wrist y, wrist above shoulder, elbow at shoulder height)
 
-        # Calculate average elbow angle if both are available
-        if left_elbow_angle is not None and right_elbow_angle is not None:
-            avg_elbow_angle = (left_elbow_angle + right_elbow_angle) / 2
-            # Position between both elbows
-            mid_x = (left_elbow['x'] + right_elbow['x']) / 2
-            mid_y = (left_elbow['y'] + right_elbow['y']) / 2
-            angles['Avg'] = {
-                'value': avg_elbow_angle,
-                'position': {
-                    'x': mid_x,
-                    'y': mid_y - 0.05  # Offset upward like in JS
-                }
-            }
-        elif left_elbow_angle is not None:
-            avg_elbow_angle = left_elbow_angle
-        elif right_elbow_angle is not None:
-            avg_elbow_angle = right_elbow_angle
-
-        # Calculate body height (y-coordinate of shoulders)
-        if all(k in left_shoulder for k in ['x', 'y']) and all(k in right_shoulder for k in ['x', 'y']):
-            body_height = (left_shoulder['y'] + right_shoulder['y']) / 2
-            mid_x = (left_shoulder['x'] + right_shoulder['x']) / 2
-            angles['Height'] = {
-                'value': body_height * 100,  # Convert to percentage
-                'position': {
-                    'x': mid_x,
-                    'y': body_height - 0.05  # Offset upward like in JS
-                }
-            }
+    Records the arm's angle and wrist-position entries; an arm missing a coordinate
+    gives (None, None, False, False) and records nothing.
+    """
+    if not (has_xy(shoulder) and has_xy(elbow) and has_xy(wrist)):
+        return None, None, False, False
 
-        # Check body alignment (straight back)
-        if (all(k in left_shoulder for k in ['x', 'y']) and all(k in right_shoulder for k in ['x', 'y']) and 
-            all(k in left_hip for k in ['x', 'y']) and all(k in right_hip for k in ['x', 'y'])):
-            
-            shoulder_mid_x = (left_shoulder['x'] + right_shoulder['x']) / 2
-            shoulder_mid_y = (left_shoulder['y'] + right_shoulder['y']) / 2
-            hip_mid_x = (left_hip['x'] + right_hip['x']) / 2
-            hip_mid_y = (left_hip['y'] + right_hip['y']) / 2
-
-            # Calculate angle between shoulders and hips to check for body alignment
-            alignment_angle = math.atan2(hip_mid_y - shoulder_mid_y, hip_mid_x - shoulder_mid_x) * 180 / math.pi
-            alignment_angle = abs(alignment_angle)
-
-            # Normalize to 0-90 degree range (0 = perfect horizontal alignment)
-            if alignment_angle > 90:
-                alignment_angle = 180 - alignment_angle
-
-            body_alignment = alignment_angle
-            angles['Align'] = {
-                'value': body_alignment,
-                'position': {
-                    'x': hip_mid_x,
-                    'y': hip_mid_y + 0.05  # Offset downward like in JS
-                }
-            }
-            
-            # Check alignment and add warning if needed
-            if body_alignment > 15:
-                warnings.append("Keep body straight!")
-
-        # Process pushup detection using elbow angles, body height, and alignment
-        status = ""
-        if avg_elbow_angle is not None and body_height is not None:
-            # Up position detection (straight arms, higher body position)
-            if avg_elbow_angle > 160 and body_height < 0.7:
-                state['stage'] = "up"
-                state['holdStart'] = current_time
-                status = "Up Position"
-
-            # Down position detection (bent arms, lower body position)
-            if avg_elbow_angle < 90 and state['stage'] == "up":
-                if current_time - state['holdStart'] > hold_threshold and current_time - state['lastRepTime'] > rep_cooldown:
-                    state['stage'] = "down"
-                    state['repCounter'] += 1
-                    state['lastRepTime'] = current_time
-                    status = "Rep Complete!"
-                    feedback = "Rep complete! Good pushup."
-                else:
-                    status = "Down Position"
-                    feedback = "Down position - hold briefly"
+    elbow_angle = calculate_angle(wrist, elbow, shoulder)
+    angles[angle_key] = (elbow_angle, elbow['x'], elbow['y'])
 
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': feedback,
-            'angles': angles,
-            'status': status,
-            'warnings': warnings
-        }
-        
-    except Exception as e:
-        print(f"Error in pushup detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': f"Error: {str(e)}",
-            'angles': {},
-            'status': "",
-            'warnings': []
-        }
+    # Current wrist position, kept for vertical movement tracking
+    wrist_y = wrist['y']
+    shoulder_y = shoulder['y']
+
+    # Check if the wrist is above the shoulder
+    wrist_above_shoulder = wrist_y < shoulder_y
+
+    # Check if the elbow is approximately at shoulder height
+    elbow_at_shoulder = abs(elbow['y'] - shoulder_y) < 0.05
+
+    angles[wrist_key] = (1 if wrist_above_shoulder else 0, wrist['x'], wrist_y)
+    return elbow_angle, wrist_y, wrist_above_shoulder, elbow_at_shoulder
+
+
+def press_transition(stage, in_down_position, in_up_position, uneven_press, moving_upward, cooldown_elapsed):
+    """Shoulder press stage machine on plain values; returns (new stage, rep counted, feedback)"""
+    # STATE TRANSITIONS with movement verification
+    if in_down_position:
+        # If we were previously in the up position and now in down, we're ready for next rep
+        if stage == "up":
+            return "down", False, "Ready for next rep"
+        if stage == "down":
+            return stage, False, "Ready position"
+        return stage, False, ""
+
+    if in_up_position:
+        # NEW: Only count rep if we were in down position AND we detected upward movement
+        if stage == "down" and moving_upward:
+            if cooldown_elapsed:
+                return "up", True, "Rep complete!"
+            return stage, False, "Slow down slightly"
+        if stage == "up":
+            return stage, False, "Lower arms to shoulder level for next rep"
+        return stage, False, ""
+
+    # FORM FEEDBACK
+    if uneven_press:
+        return stage, False, "Press both arms evenly"
+    if stage == "up":
+        return stage, False, "Lower arms to shoulder level"
+    return stage, False, "Continue the movement"
 
 
 def process_shoulder_press(landmarks, state, current_time, rep_cooldown, hold_threshold):
     """Process landmarks for shoulder press exercise with improved position tracking"""
-    try:
-        # Get landmarks for both arms
-        left_shoulder = landmarks[11]
-        left_elbow = landmarks[13]
-        left_wrist = landmarks[15]
-        right_shoulder = landmarks[12]
-        right_elbow = landmarks[14]
-        right_wrist = landmarks[16]
-
-        # Variables to store angles and positions
-        left_elbow_angle = None
-        right_elbow_angle = None
-        left_wrist_above_shoulder = False
-        right_wrist_above_shoulder = False
-        left_elbow_at_shoulder = False
-        right_elbow_at_shoulder = False
-        
-        # Store wrist positions for vertical movement tracking
-        left_wrist_y = None
-        right_wrist_y = None
-        
-        # Add position history tracking if not present in state
-        if 'prev_left_wrist_y' not in state:
-            state['prev_left_wrist_y'] = None
-        if 'prev_right_wrist_y' not in state:
-            state['prev_right_wrist_y'] = None
-            
-        angles = {}
-        feedback = ""
-
-        # Calculate left arm position and angle
-        if all(k in left_shoulder for k in ['x', 'y']) and all(k in left_elbow for k in ['x', 'y']) and all(k in left_wrist for k in ['x', 'y']):
-            left_elbow_angle = calculate_angle(left_wrist, left_elbow, left_shoulder)
-            angles['L'] = {
-                'value': left_elbow_angle,
-                'position': {
-                    'x': left_elbow['x'],
-                    'y': left_elbow['y']
-                }
-            }
+    # Get landmarks for both arms
+    left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist = ARM_POINTS(landmarks)
 
-            # Store current wrist position
-            left_wrist_y = left_wrist['y']
-            
-            # Check if left wrist is above shoulder
-            left_wrist_above_shoulder = left_wrist['y'] < left_shoulder['y']
-            
-            # Check if left elbow is approximately at shoulder height
-            left_elbow_at_shoulder = abs(left_elbow['y'] - left_shoulder['y']) < 0.05
-            
-            angles['LWristPos'] = {
-                'value': 1 if left_wrist_above_shoulder else 0,
-                'position': {
-                    'x': left_wrist['x'],
-                    'y': left_wrist['y']
-                }
-            }
+    angles = {}
+    feedback = ""
 
-        # Calculate right arm position and angle
-        if all(k in right_shoulder for k in ['x', 'y']) and all(k in right_elbow for k in ['x', 'y']) and all(k in right_wrist for k in ['x', 'y']):
-            right_elbow_angle = calculate_angle(right_wrist, right_elbow, right_shoulder)
-            angles['R'] = {
-                'value': right_elbow_angle,
-                'position': {
-                    'x': right_elbow['x'],
-                    'y': right_elbow['y']
-                }
-            }
+    # Per-arm angle and position features, one shared extraction for both sides
+    left_elbow_angle, left_wrist_y, left_wrist_above_shoulder, left_elbow_at_shoulder = press_arm_features(
+        angles, 'L', 'LWristPos', left_shoulder, left_elbow, left_wrist)
+    right_elbow_angle, right_wrist_y, right_wrist_above_shoulder, right_elbow_at_shoulder = press_arm_features(
+        angles, 'R', 'RWristPos', right_shoulder, right_elbow, right_wrist)
 
-            # Store current wrist position
-            right_wrist_y = right_wrist['y']
-            
-            # Check if right wrist is above shoulder
-            right_wrist_above_shoulder = right_wrist['y'] < right_shoulder['y']
-            
-            # Check if right elbow is approximately at shoulder height
-            right_elbow_at_shoulder = abs(right_elbow['y'] - right_shoulder['y']) < 0.05
-            
-            angles['RWristPos'] = {
-                'value': 1 if right_wrist_above_shoulder else 0,
-                'position': {
-                    'x': right_wrist['x'],
-                    'y': right_wrist['y']
-                }
-            }
+    # Average elbow angle from whichever arms are available
+    avg_elbow_angle = average_angle(angles, left_elbow_angle, right_elbow_angle, left_elbow, right_elbow)
 
-        # Calculate average elbow angle if both are available
-        avg_elbow_angle = None
-        if left_elbow_angle is not None and right_elbow_angle is not None:
-            avg_elbow_angle = (left_elbow_angle + right_elbow_angle) / 2
-            mid_x = (left_elbow['x'] + right_elbow['x']) / 2
-            mid_y = (left_elbow['y'] + right_elbow['y']) / 2
-            angles['Avg'] = {
-                'value': avg_elbow_angle,
-                'position': {
-                    'x': mid_x,
-                    'y': mid_y
-                }
-            }
-        elif left_elbow_angle is not None:
-            avg_elbow_angle = left_elbow_angle
-        elif right_elbow_angle is not None:
-            avg_elbow_angle = right_elbow_angle
-
-        # Determine arm positions 
-        both_wrists_above_shoulder = left_wrist_above_shoulder and right_wrist_above_shoulder
-        one_wrist_above_shoulder = left_wrist_above_shoulder or right_wrist_above_shoulder
-        elbows_at_shoulder_level = (left_elbow_at_shoulder or right_elbow_at_shoulder)
-        
-        # NEW: Detect upward movement by comparing current and previous wrist positions
-        moving_upward = False
-        
-        # For left arm movement
-        if left_wrist_y is not None and state['prev_left_wrist_y'] is not None:
-            left_moving_up = left_wrist_y < state['prev_left_wrist_y']
-            angles['LMovingUp'] = {
-                'value': 1 if left_moving_up else 0,
-                'position': {
-                    'x': left_wrist['x'] - 0.1,
-                    'y': left_wrist['y']
-                }
-            }
-        else:
-            left_moving_up = False
-            
-        # For right arm movement
-        if right_wrist_y is not None and state['prev_right_wrist_y'] is not None:
-            right_moving_up = right_wrist_y < state['prev_right_wrist_y']
-            angles['RMovingUp'] = {
-                'value': 1 if right_moving_up else 0,
-                'position': {
-                    'x': right_wrist['x'] + 0.1,
-                    'y': right_wrist['y']
-                }
-            }
-        else:
-            right_moving_up = False
-            
-        # Consider moving upward if either arm is clearly moving up
-        # Use a significant threshold to avoid minor fluctuations
-        if (left_moving_up and left_wrist_y is not None and state['prev_left_wrist_y'] is not None and 
-           (state['prev_left_wrist_y'] - left_wrist_y > 0.01)):
-            moving_upward = True
-        if (right_moving_up and right_wrist_y is not None and state['prev_right_wrist_y'] is not None and 
-           (state['prev_right_wrist_y'] - right_wrist_y > 0.01)):
-            moving_upward = True
+    # Determine arm positions 
+    both_wrists_above_shoulder = left_wrist_above_shoulder and right_wrist_above_shoulder
+    one_wrist_above_shoulder = left_wrist_above_shoulder or right_wrist_above_shoulder
+    elbows_at_shoulder_level = (left_elbow_at_shoulder or right_elbow_at_shoulder)
+    
+    # NEW: Detect upward movement by comparing current and previous wrist positions
+    prev_left_wrist_y = state.prev_left_wrist_y
+    prev_right_wrist_y = state.prev_right_wrist_y
+
+    # Consider moving upward if either arm is clearly moving up, using a
+    # significant threshold to avoid minor fluctuations
+    moving_upward = False
+
+    # For left arm movement
+    if left_wrist_y is not None and prev_left_wrist_y is not None:
+        left_moving_up = left_wrist_y < prev_left_wrist_y
+        angles['LMovingUp'] = (1 if left_moving_up else 0, left_wrist['x'] - 0.1, left_wrist['y'])
+        moving_upward = prev_left_wrist_y - left_wrist_y > 0.01
+
+    # For right arm movement
+    if right_wrist_y is not None and prev_right_wrist_y is not None:
+        right_moving_up = right_wrist_y < prev_right_wrist_y
+        angles['RMovingUp'] = (1 if right_moving_up else 0, right_wrist['x'] + 0.1, right_wrist['y'])
+        moving_upward = moving_upward or prev_right_wrist_y - right_wrist_y > 0.01
+    
+    # Process shoulder press detection with position tracking
+    if avg_elbow_angle is not None:
+        # DOWN POSITION: Arms bent, elbows near shoulders
+        in_down_position = (avg_elbow_angle < 120.0) and (elbows_at_shoulder_level or not both_wrists_above_shoulder)
         
-        # Process shoulder press detection with position tracking
-        if avg_elbow_angle is not None:
-            # DOWN POSITION: Arms bent, elbows near shoulders
-            in_down_position = (avg_elbow_angle < 120) and (elbows_at_shoulder_level or not both_wrists_above_shoulder)
-            
-            # UP POSITION: Arms extended, wrists above shoulders
-            in_up_position = (avg_elbow_angle > 140 and both_wrists_above_shoulder) or (avg_elbow_angle > 150 and one_wrist_above_shoulder)
-            
-            # STATE TRANSITIONS with movement verification
-            if in_down_position:
-                # If we were previously in the up position and now in down, we're ready for next rep
-                if state['stage'] == "up":
-                    state['stage'] = "down"
-                    feedback = "Ready for next rep"
-                elif state['stage'] == "down":
-                    feedback = "Ready position"
-                
-                state['holdStart'] = current_time
-                
-            elif in_up_position:
-                # NEW: Only count rep if we were in down position AND we detected upward movement
-                if state['stage'] == "down" and moving_upward:
-                    if current_time - state['lastRepTime'] > rep_cooldown:
-                        state['repCounter'] += 1
-                        state['lastRepTime'] = current_time
-                        state['stage'] = "up"
-                        feedback = "Rep complete!"
-                    else:
-                        feedback = "Slow down slightly"
-                elif state['stage'] == "up":
-                    feedback = "Lower arms to shoulder level for next rep"
-            
-            # FORM FEEDBACK
-            elif one_wrist_above_shoulder and not both_wrists_above_shoulder:
-                feedback = "Press both arms evenly"
-            elif not feedback:
-                if state['stage'] == "up":
-                    feedback = "Lower arms to shoulder level"
-                else:
-                    feedback = "Continue the movement"
-
-        # Update position history for next frame
-        state['prev_left_wrist_y'] = left_wrist_y
-        state['prev_right_wrist_y'] = right_wrist_y
+        # UP POSITION: Arms extended, wrists above shoulders
+        in_up_position = (avg_elbow_angle > 140.0 and both_wrists_above_shoulder) or (avg_elbow_angle > 150.0 and one_wrist_above_shoulder)
+
+        if in_down_position:
+            state.hold_start = current_time
+
+        cooldown_elapsed = current_time - state.last_rep_time > rep_cooldown
+        state.stage, rep_counted, feedback = press_transition(
+            state.stage, in_down_position, in_up_position, one_wrist_above_shoulder and not both_wrists_above_shoulder,
+            moving_upward, cooldown_elapsed)
+        if rep_counted:
+            state.rep_counter += 1
+            state.last_rep_time = current_time
+
+    # Update position history for next frame
+    state.prev_left_wrist_y = left_wrist_y
+    state.prev_right_wrist_y = right_wrist_y
+
+    return {
+        'repCounter': state.rep_counter,
+        'stage': state.stage,
+        'feedback': feedback,
+        'angles': angles
+    }
 
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': feedback,
-            'angles': angles
-        }
-        
-    except Exception as e:
-        print(f"Error in shoulder press detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': f"Error: {str(e)}"
-        }
 
 def process_tricep_extension(landmarks, state, current_time, rep_cooldown, hold_threshold):
     """Process landmarks for tricep extension exercise with improved visibility checks"""
+    # Both arms
+    left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist = ARM_POINTS(landmarks)
+
+    # Track state for both arms
+    left_angle = None
+    right_angle = None
+    left_extension_detected = False
+    right_extension_detected = False
+    angles = {}
+    
+    # Unpack each arm once; a missing point, coordinate or visibility means that arm is not visible
     try:
-        # Left arm
-        left_shoulder = landmarks[11]
-        left_elbow = landmarks[13]
-        left_wrist = landmarks[15]
-
-        # Right arm
-        right_shoulder = landmarks[12]
-        right_elbow = landmarks[14]
-        right_wrist = landmarks[16]
-
-        # Track state for both arms
-        left_angle = None
-        right_angle = None
-        left_extension_detected = False
-        right_extension_detected = False
-        angles = {}
-        
-        # Check for visibility of arm parts
-        left_arm_visible = (all(k in left_shoulder for k in ['x', 'y', 'visibility']) and 
-                           all(k in left_elbow for k in ['x', 'y', 'visibility']) and 
-                           all(k in left_wrist for k in ['x', 'y', 'visibility']) and
-                           left_shoulder.get('visibility', 0) > 0.5 and 
-                           left_elbow.get('visibility', 0) > 0.5 and 
-                           left_wrist.get('visibility', 0) > 0.5)
-        
-        right_arm_visible = (all(k in right_shoulder for k in ['x', 'y', 'visibility']) and 
-                            all(k in right_elbow for k in ['x', 'y', 'visibility']) and 
-                            all(k in right_wrist for k in ['x', 'y', 'visibility']) and
-                            right_shoulder.get('visibility', 0) > 0.5 and 
-                            right_elbow.get('visibility', 0) > 0.5 and 
-                            right_wrist.get('visibility', 0) > 0.5)
-        
-        # If no arms are clearly visible, return early with visibility warning
-        if not (left_arm_visible or right_arm_visible):
-            return {
-                'repCounter': state['repCounter'],
-                'stage': state.get('stage', 'down'),
-                'feedback': "Arms not clearly visible. Adjust position or camera.",
-                'angles': angles,
-                'visibility': False
-            }
-
-        # Calculate and store left arm angle if visible
-        if left_arm_visible:
-            left_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-            # Store angle with position data
-            angles['L'] = {
-                'value': left_angle,
-                'position': {
-                    'x': left_elbow['x'],
-                    'y': left_elbow['y']
-                }
-            }
-
-            # Detect left arm extension
-            # For tricep extension: DOWN is bent (<90), UP is extended (>150)
-            if left_angle < 90:
-                state['leftArmStage'] = "down"
-                state['leftArmHoldStart'] = current_time
-            if left_angle > 150 and state['leftArmStage'] == "down":
-                if current_time - state['leftArmHoldStart'] > hold_threshold:
-                    left_extension_detected = True
-                    state['leftArmStage'] = "up"
-
-        # Calculate and store right arm angle if visible
-        if right_arm_visible:
-            right_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-            # Store angle with position data
-            angles['R'] = {
-                'value': right_angle,
-                'position': {
-                    'x': right_elbow['x'],
-                    'y': right_elbow['y']
-                }
-            }
-
-            # Detect right arm extension
-            # For tricep extension: DOWN is bent (<90), UP is extended (>150)
-            if right_angle < 90:
-                state['rightArmStage'] = "down"
-                state['rightArmHoldStart'] = current_time
-            if right_angle > 150 and state['rightArmStage'] == "down":
-                if current_time - state['rightArmHoldStart'] > hold_threshold:
-                    right_extension_detected = True
-                    state['rightArmStage'] = "up"
-
-        # Count rep if either arm completes an extension and enough time has passed since last rep
-        if (left_extension_detected or right_extension_detected) and current_time - state['lastRepTime'] > rep_cooldown:
-            state['repCounter'] += 1
-            state['lastRepTime'] = current_time
-            
-            # Generate feedback
-            feedback = "Good rep!"
-            if left_extension_detected and right_extension_detected:
-                feedback = "Great form! Both arms extended."
-            elif left_extension_detected:
-                feedback = "Left arm extension detected."
-            elif right_extension_detected:
-                feedback = "Right arm extension detected."
-
-            return {
-                'repCounter': state['repCounter'],
-                'stage': 'up' if left_extension_detected or right_extension_detected else 'down',
-                'feedback': feedback,
-                'angles': angles,
-                'visibility': True
-            }
+        left_shoulder_x, left_shoulder_y, left_shoulder_visibility = left_shoulder['x'], left_shoulder['y'], left_shoulder['visibility']
+        left_elbow_x, left_elbow_y, left_elbow_visibility = left_elbow['x'], left_elbow['y'], left_elbow['visibility']
+        left_wrist_x, left_wrist_y, left_wrist_visibility = left_wrist['x'], left_wrist['y'], left_wrist['visibility']
+        left_arm_visible = left_shoulder_visibility > 0.5 and left_elbow_visibility > 0.5 and left_wrist_visibility > 0.5
+    except (KeyError, TypeError):
+        left_arm_visible = False
+    try:
+        right_shoulder_x, right_shoulder_y, right_shoulder_visibility = right_shoulder['x'], right_shoulder['y'], right_shoulder['visibility']
+        right_elbow_x, right_elbow_y, right_elbow_visibility = right_elbow['x'], right_elbow['y'], right_elbow['visibility']
+        right_wrist_x, right_wrist_y, right_wrist_visibility = right_wrist['x'], right_wrist['y'], right_wrist['visibility']
+        right_arm_visible = right_shoulder_visibility > 0.5 and right_elbow_visibility > 0.5 and right_wrist_visibility > 0.5
+    except (KeyError, TypeError):
+        right_arm_visible = False
+    
+    # If no arms are clearly visible, return early with visibility warning
+    if not (left_arm_visible or right_arm_visible):
+        return {
+            'repCounter': state.rep_counter,
+            'stage': state.stage,
+            'feedback': "Arms not clearly visible. Adjust position or camera.",
+            'angles': angles,
+            'visibility': False
+        }
 
-        # If we've reached here, determine the current stage
-        current_stage = 'down'
-        if left_arm_visible and state.get('leftArmStage') == 'up':
-            current_stage = 'up'
-        elif right_arm_visible and state.get('rightArmStage') == 'up':
-            current_stage = 'up'
-        
-        # Generate appropriate feedback based on visibility and position
-        feedback = ""
-        if left_arm_visible and right_arm_visible:
-            feedback = "Both arms visible. "
-            if current_stage == 'down':
-                feedback += "Extend arms to complete the rep."
-            else:
-                feedback += "Bend arms to prepare for next rep."
-        elif left_arm_visible:
-            feedback = "Left arm visible. "
-            if current_stage == 'down':
-                feedback += "Extend arm to complete the rep."
-            else:
-                feedback += "Bend arm to prepare for next rep."
-        elif right_arm_visible:
-            feedback = "Right arm visible. "
-            if current_stage == 'down':
-                feedback += "Extend arm to complete the rep."
-            else:
-                feedback += "Bend arm to prepare for next rep."
+    # Work on the lane state in locals and write it back once
+    left_arm_stage, left_arm_hold_start = state.left_arm_stage, state.left_arm_hold_start
+    right_arm_stage, right_arm_hold_start = state.right_arm_stage, state.right_arm_hold_start
+
+    # Calculate and store left arm angle if visible
+    if left_arm_visible:
+        left_angle = angle_between(left_shoulder_x, left_shoulder_y, left_elbow_x, left_elbow_y, left_wrist_x, left_wrist_y)
+        # Store angle with position data
+        angles['L'] = (left_angle, left_elbow_x, left_elbow_y)
+
+        # Detect left arm extension
+        # For tricep extension: DOWN is bent (<90), UP is extended (>150)
+        left_arm_stage, left_arm_hold_start, left_extension_detected = extension_lane_step(
+            left_angle, left_arm_stage, left_arm_hold_start, current_time, hold_threshold)
+
+    # Calculate and store right arm angle if visible
+    if right_arm_visible:
+        right_angle = angle_between(right_shoulder_x, right_shoulder_y, right_elbow_x, right_elbow_y, right_wrist_x, right_wrist_y)
+        # Store angle with position data
+        angles['R'] = (right_angle, right_elbow_x, right_elbow_y)
+
+        # Detect right arm extension
+        # For tricep extension: DOWN is bent (<90), UP is extended (>150)
+        right_arm_stage, right_arm_hold_start, right_extension_detected = extension_lane_step(
+            right_angle, right_arm_stage, right_arm_hold_start, current_time, hold_threshold)
+
+    state.left_arm_stage, state.left_arm_hold_start = left_arm_stage, left_arm_hold_start
+    state.right_arm_stage, state.right_arm_hold_start = right_arm_stage, right_arm_hold_start
+
+    # Count rep if either arm completes an extension and enough time has passed since last rep
+    if (left_extension_detected or right_extension_detected) and current_time - state.last_rep_time > rep_cooldown:
+        state.rep_counter += 1
+        state.last_rep_time = current_time
+
+        if left_extension_detected and right_extension_detected:
+            feedback = "Great form! Both arms extended."
+        elif left_extension_detected:
+            feedback = "Left arm extension detected."
+        else:
+            feedback = "Right arm extension detected."
 
         return {
-            'repCounter': state['repCounter'],
-            'stage': current_stage,
+            'repCounter': state.rep_counter,
+            'stage': 'up',
             'feedback': feedback,
             'angles': angles,
             'visibility': True
         }
-        
-    except Exception as e:
-        print(f"Error in tricep extension detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state.get('stage', 'down'),
-            'feedback': f"Error: {str(e)}",
-            'visibility': False
-        }
 
-def process_lunge(landmarks, state, current_time, rep_cooldown, hold_threshold):
-    """Process landmarks for lunge exercise with stricter movement verification"""
-    try:
-        # Get landmarks for both sides of the body
-        left_hip = landmarks[23]
-        left_knee = landmarks[25]
-        left_ankle = landmarks[27]
-        right_hip = landmarks[24]
-        right_knee = landmarks[26]
-        right_ankle = landmarks[28]
-
-        # Check if at least one leg is fully visible
-        left_leg_visible = all(point and all(k in point for k in ['x', 'y']) 
-                              for point in [left_hip, left_knee, left_ankle])
-        right_leg_visible = all(point and all(k in point for k in ['x', 'y']) 
-                               for point in [right_hip, right_knee, right_ankle])
-        
-        if not (left_leg_visible or right_leg_visible):
-            return {
-                'repCounter': state['repCounter'],
-                'stage': state['stage'],
-                'feedback': "Position not clear - adjust camera",
-                'angles': {}
-            }
+    # If we've reached here, determine the current stage
+    arm_up = (left_arm_visible and left_arm_stage == 'up') or (right_arm_visible and right_arm_stage == 'up')
+    current_stage = 'up' if arm_up else 'down'
+
+    # Generate appropriate feedback based on visibility and position (at least one arm is visible here)
+    if left_arm_visible and right_arm_visible:
+        feedback = "Both arms visible. Bend arms to prepare for next rep." if arm_up else "Both arms visible. Extend arms to complete the rep."
+    elif left_arm_visible:
+        feedback = "Left arm visible. Bend arm to prepare for next rep." if arm_up else "Left arm visible. Extend arm to complete the rep."
+    else:
+        feedback = "Right arm visible. Bend arm to prepare for next rep." if arm_up else "Right arm visible. Extend arm to complete the rep."
+
+    return {
+        'repCounter': state.rep_counter,
+        'stage': current_stage,
+        'feedback': feedback,
+        'angles': angles,
+        'visibility': True
+    }
 
-        angles = {}
-        left_leg_angle = None
-        right_leg_angle = None
-        
-        # Calculate leg angles for both sides if landmarks are visible
-        if left_leg_visible:
-            left_leg_angle = calculate_angle(
-                {'x': left_hip['x'], 'y': left_hip['y']},
-                {'x': left_knee['x'], 'y': left_knee['y']},
-                {'x': left_ankle['x'], 'y': left_ankle['y']}
-            )
-            angles['LLeg'] = {
-                'value': left_leg_angle,
-                'position': {
-                    'x': left_knee['x'],
-                    'y': left_knee['y']
-                }
-            }
 
-        if right_leg_visible:
-            right_leg_angle = calculate_angle(
-                {'x': right_hip['x'], 'y': right_hip['y']},
-                {'x': right_knee['x'], 'y': right_knee['y']},
-                {'x': right_ankle['x'], 'y': right_ankle['y']}
-            )
-            angles['RLeg'] = {
-                'value': right_leg_angle,
-                'position': {
-                    'x': right_knee['x'],
-                    'y': right_knee['y']
-                }
-            }
+def lunge_transition(stage, standing_detected, lunge_detected, significant_movement, cooldown_elapsed):
+    """Lunge stage machine on plain values; returns (new stage, rep counted, feedback)"""
+    # Standing and lunge detection are mutually exclusive (legs straight vs. a leg bent),
+    # so at most one branch applies and each decided case returns immediately
+
+    # Handle standing position detection (up position)
+    if standing_detected:
+        if stage == "down":
+            # Only transition if we see significant movement
+            if significant_movement:
+                return "up", False, "Ready for next lunge"
+            # Not enough movement to confirm transition
+            return stage, False, "Return to standing position"
+        if stage == "up":
+            return stage, False, "Standing position"
+
+    # Handle lunge position detection (down position)
+    elif lunge_detected:
+        # STRICTER REP COUNTING: Only count when:
+        # 1. We're in standing position
+        # 2. There's significant movement AND angle change
+        # 3. Cooldown has passed
+        if stage == "up" and significant_movement:
+            if cooldown_elapsed:
+                return "down", True, "Rep counted! Good lunge."
+            return stage, False, "Slow down slightly"
+        if stage == "down":
+            return stage, False, "Return to standing position"
+
+    # Default feedback when no transition applied
+    if stage == "up":
+        return stage, False, "Step forward into lunge position"
+    return stage, False, "Return to standing position"
 
-        # If both knees are visible, calculate height difference
-        knee_height_diff = 0
-        if left_leg_visible and right_leg_visible:
-            knee_height_diff = abs(left_knee['y'] - right_knee['y'])
-            angles['KneeDiff'] = {
-                'value': knee_height_diff * 100,
-                'position': {
-                    'x': (left_knee['x'] + right_knee['x']) / 2,
-                    'y': (left_knee['y'] + right_knee['y']) / 2
-                }
-            }
 
-        # IMPROVED POSITION TRACKING
-        # Initialize tracking values if they don't exist
-        if 'prev_left_knee_y' not in state:
-            state['prev_left_knee_y'] = None
-        if 'prev_right_knee_y' not in state:
-            state['prev_right_knee_y'] = None
-        if 'movement_history' not in state:
-            state['movement_history'] = []
-        if 'angle_history' not in state:
-            state['angle_history'] = []
-        
-        # RECORD MOVEMENT DATA
-        # Track knee positions and movements
-        left_knee_movement = 0
-        right_knee_movement = 0
-        
-        if left_leg_visible and state['prev_left_knee_y'] is not None:
-            left_knee_movement = left_knee['y'] - state['prev_left_knee_y']
-            angles['LKneeMove'] = {
-                'value': left_knee_movement * 100,
-                'position': {
-                    'x': left_knee['x'] - 0.1,
-                    'y': left_knee['y']
-                }
-            }
-        
-        if right_leg_visible and state['prev_right_knee_y'] is not None:
-            right_knee_movement = right_knee['y'] - state['prev_right_knee_y']
-            angles['RKneeMove'] = {
-                'value': right_knee_movement * 100,
-                'position': {
-                    'x': right_knee['x'] + 0.1,
-                    'y': right_knee['y']
-                }
-            }
-        
-        # Store movement data in history (keep last 5 frames)
-        movement_data = {
-            'left': left_knee_movement,
-            'right': right_knee_movement,
-            'time': current_time
-        }
-        state['movement_history'].append(movement_data)
-        if len(state['movement_history']) > 5:
-            state['movement_history'].pop(0)
-            
-        # Store angle data in history (keep last 5 frames)
-        angle_data = {
-            'left': left_leg_angle,
-            'right': right_leg_angle,
-            'time': current_time
+def process_lunge(landmarks, state, current_time, rep_cooldown, hold_threshold):
+    """Process landmarks for lunge exercise with stricter movement verification"""
+    # Get landmarks for both sides of the body
+    left_hip, left_knee, left_ankle, right_hip, right_knee, right_ankle = LEG_POINTS(landmarks)
+
+    # Unpack each leg once; a missing point or coordinate means that leg is not visible
+    try:
+        left_hip_x, left_hip_y = left_hip['x'], left_hip['y']
+        left_knee_x, left_knee_y = left_knee['x'], left_knee['y']
+        left_ankle_x, left_ankle_y = left_ankle['x'], left_ankle['y']
+        left_leg_visible = True
+    except (KeyError, TypeError):
+        left_leg_visible = False
+    try:
+        right_hip_x, right_hip_y = right_hip['x'], right_hip['y']
+        right_knee_x, right_knee_y = right_knee['x'], right_knee['y']
+        right_ankle_x, right_ankle_y = right_ankle['x'], right_ankle['y']
+        right_leg_visible = True
+    except (KeyError, TypeError):
+        right_leg_visible = False
+    
+    if not (left_leg_visible or right_leg_visible):
+        return {
+            'repCounter': state.rep_counter,
+            'stage': state.stage,
+            'feedback': "Position not clear - adjust camera",
+            'angles': {}
         }
-        state['angle_history'].append(angle_data)
-        if len(state['angle_history']) > 5:
-            state['angle_history'].pop(0)
-            
-        # VERIFY SUSTAINED MOVEMENT
-        # Calculate average movement over the last few frames to detect real movement vs jitter
-        left_avg_movement = 0
-        right_avg_movement = 0
-        movement_count = 0
+
+    angles = {}
+    left_leg_angle = None
+    right_leg_angle = None
+    
+    # Calculate leg angles for both sides if landmarks are visible
+    if left_leg_visible:
+        left_leg_angle = angle_between(left_hip_x, left_hip_y, left_knee_x, left_knee_y, left_ankle_x, left_ankle_y)
+        angles['LLeg'] = (left_leg_angle, left_knee_x, left_knee_y)
+
+    if right_leg_visible:
+        right_leg_angle = angle_between(right_hip_x, right_hip_y, right_knee_x, right_knee_y, right_ankle_x, right_ankle_y)
+        angles['RLeg'] = (right_leg_angle, right_knee_x, right_knee_y)
+
+    # If both knees are visible, calculate height difference
+    knee_height_diff = 0.0
+    if left_leg_visible and right_leg_visible:
+        knee_height_diff = abs(left_knee_y - right_knee_y)
+        angles['KneeDiff'] = (knee_height_diff * 100, (left_knee_x + right_knee_x) * 0.5, (left_knee_y + right_knee_y) * 0.5)
+
+    # RECORD MOVEMENT DATA
+    # Bind the per-session history once; the deques are mutated in place
+    prev_left_knee_y = state.prev_left_knee_y
+    prev_right_knee_y = state.prev_right_knee_y
+    movement_history = state.movement_history
+    angle_history = state.angle_history
+
+    # Track knee positions and movements
+    left_knee_movement = 0
+    right_knee_movement = 0
+    
+    if left_leg_visible and prev_left_knee_y is not None:
+        left_knee_movement = left_knee_y - prev_left_knee_y
+        angles['LKneeMove'] = (left_knee_movement * 100, left_knee_x - 0.1, left_knee_y)
+    
+    if right_leg_visible and prev_right_knee_y is not None:
+        right_knee_movement = right_knee_y - prev_right_knee_y
+        angles['RKneeMove'] = (right_knee_movement * 100, right_knee_x + 0.1, right_knee_y)
+    
+    # Store movement data in history (the bounded deque keeps the last few frames) as (left, right) pairs
+    movement_history.append((left_knee_movement, right_knee_movement))
         
-        for data in state['movement_history']:
-            if data['left'] is not None:
-                left_avg_movement += data['left']
-                movement_count += 1
-            if data['right'] is not None:
-                right_avg_movement += data['right']
-                movement_count += 1
-                
-        if movement_count > 0:
-            left_avg_movement /= movement_count
-            right_avg_movement /= movement_count
-            
-        # VERIFY SIGNIFICANT ANGLE CHANGE
-        # Calculate how much the leg angles have changed recently
-        left_angle_change = 0
-        right_angle_change = 0
+    # Store angle data in history the same way
+    angle_history.append((left_leg_angle, right_leg_angle))
         
-        if len(state['angle_history']) >= 2:
-            latest = state['angle_history'][-1]
-            previous = state['angle_history'][0]
+    # VERIFY SUSTAINED MOVEMENT
+    # Calculate average movement over the last few frames to detect real movement vs jitter
+    left_avg_movement = 0
+    right_avg_movement = 0
+    movement_count = 0
+    
+    for left_movement, right_movement in movement_history:
+        if left_movement is not None:
+            left_avg_movement += left_movement
+            movement_count += 1
+        if right_movement is not None:
+            right_avg_movement += right_movement
+            movement_count += 1
             
-            if latest['left'] is not None and previous['left'] is not None:
-                left_angle_change = abs(latest['left'] - previous['left'])
-                
-            if latest['right'] is not None and previous['right'] is not None:
-                right_angle_change = abs(latest['right'] - previous['right'])
-        
-        # DETERMINE IF ACTUAL EXERCISE MOVEMENT IS HAPPENING
-        # We consider it significant movement if:
-        # 1. There's consistent movement trend in knee position over multiple frames
-        # 2. There's significant change in knee angles
-        significant_movement = False
-        significant_angle_change = (left_angle_change > 20 or right_angle_change > 20)
-        consistent_movement = (abs(left_avg_movement) > 0.01 or abs(right_avg_movement) > 0.01)
+    if movement_count > 0:
+        left_avg_movement /= movement_count
+        right_avg_movement /= movement_count
         
-        if significant_angle_change and consistent_movement:
-            significant_movement = True
-            angles['SignificantMove'] = {
-                'value': 1,
-                'position': {
-                    'x': 0.1,
-                    'y': 0.1
-                }
-            }
+    # VERIFY SIGNIFICANT ANGLE CHANGE
+    # Calculate how much the leg angles have changed recently
+    left_angle_change = 0.0
+    right_angle_change = 0.0
+    
+    if len(angle_history) >= 2:
+        latest_left, latest_right = angle_history[-1]
+        previous_left, previous_right = angle_history[0]
         
-        # Store current positions for next frame comparison
-        if left_leg_visible:
-            state['prev_left_knee_y'] = left_knee['y']
-        if right_leg_visible:
-            state['prev_right_knee_y'] = right_knee['y']
-
-        # POSITION DETECTION
-        # Standing position - both legs relatively straight
-        standing_detected = False
-        if left_leg_visible and right_leg_visible:
-            # Both legs visible - check if both are straight-ish
-            standing_detected = (left_leg_angle > 150 and right_leg_angle > 150 and knee_height_diff < 0.15)
-        elif left_leg_visible and left_leg_angle > 150:
-            # Only left leg visible and it's straight
-            standing_detected = True
-        elif right_leg_visible and right_leg_angle > 150:
-            # Only right leg visible and it's straight
-            standing_detected = True
+        if latest_left is not None and previous_left is not None:
+            left_angle_change = abs(latest_left - previous_left)
             
-        # Lunge position - one leg bent
-        lunge_detected = False
-        
-        # Check for lunge position with more lenient criteria
-        if left_leg_visible and right_leg_visible:
-            # One leg is sufficiently bent AND knees have height difference
-            lunge_detected = ((left_leg_angle < 110 or right_leg_angle < 110) and knee_height_diff > 0.2)
-        elif left_leg_visible and left_leg_angle < 110:
-            # Only left leg visible and it's bent
-            lunge_detected = True
-        elif right_leg_visible and right_leg_angle < 110:
-            # Only right leg visible and it's bent
-            lunge_detected = True
-
-        # STATE TRANSITIONS WITH STRICTER VERIFICATION
-        feedback = ""
-        
-        # Handle standing position detection (up position)
-        if standing_detected:
-            if state['stage'] == "down":
-                # Only transition if we see significant movement
-                if significant_movement:
-                    state['stage'] = "up"
-                    feedback = "Ready for next lunge"
-                else:
-                    # Not enough movement to confirm transition
-                    feedback = "Return to standing position"
-            elif state['stage'] == "up":
-                feedback = "Standing position"
-
-        # Handle lunge position detection (down position)
-        if lunge_detected:
-            # STRICTER REP COUNTING: Only count when:
-            # 1. We're in standing position
-            # 2. There's significant movement AND angle change
-            # 3. Cooldown has passed
-            if state['stage'] == "up" and significant_movement:
-                if current_time - state['lastRepTime'] > rep_cooldown:
-                    state['stage'] = "down"
-                    state['repCounter'] += 1
-                    state['lastRepTime'] = current_time
-                    feedback = "Rep counted! Good lunge."
-                else:
-                    feedback = "Slow down slightly"
-            elif state['stage'] == "down":
-                feedback = "Return to standing position"
-
-        # Default feedback if none set yet
-        if not feedback:
-            if state['stage'] == "up":
-                feedback = "Step forward into lunge position"
-            else:
-                feedback = "Return to standing position"
-
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': feedback,
-            'angles': angles
-        }
-        
-    except Exception as e:
-        print(f"Error in lunge detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['stage'],
-            'feedback': f"Error: {str(e)}",
-            'angles': {}
-        }
+        if latest_right is not None and previous_right is not None:
+            right_angle_change = abs(latest_right - previous_right)
+    
+    # DETERMINE IF ACTUAL EXERCISE MOVEMENT IS HAPPENING
+    # We consider it significant movement if:
+    # 1. There's consistent movement trend in knee position over multiple frames
+    # 2. There's significant change in knee angles
+    significant_movement = (max(left_angle_change, right_angle_change) > LUNGE_ANGLE_CHANGE
+                            and max(abs(left_avg_movement), abs(right_avg_movement)) > LUNGE_MIN_MOVEMENT)
+    
+    if significant_movement:
+        angles['SignificantMove'] = (1, 0.1, 0.1)
+    
+    # Store current positions for next frame comparison
+    if left_leg_visible:
+        state.prev_left_knee_y = left_knee_y
+    if right_leg_visible:
+        state.prev_right_knee_y = right_knee_y
+
+    # POSITION DETECTION
+    # Standing: legs relatively straight. Lunge: one leg bent.
+    # One visibility dispatch decides both (at least one leg is visible here)
+    if left_leg_visible and right_leg_visible:
+        # Both legs straight-ish with knees level
+        standing_detected = (left_leg_angle > LUNGE_STRAIGHT_ANGLE and right_leg_angle > LUNGE_STRAIGHT_ANGLE and knee_height_diff < LUNGE_STANDING_KNEE_DIFF)
+        # One leg is sufficiently bent AND knees have height difference
+        lunge_detected = ((left_leg_angle < LUNGE_BENT_ANGLE or right_leg_angle < LUNGE_BENT_ANGLE) and knee_height_diff > LUNGE_KNEE_DIFF)
+    elif left_leg_visible:
+        # Only left leg visible: straight or bent
+        standing_detected = left_leg_angle > LUNGE_STRAIGHT_ANGLE
+        lunge_detected = left_leg_angle < LUNGE_BENT_ANGLE
+    else:
+        # Only right leg visible: straight or bent
+        standing_detected = right_leg_angle > LUNGE_STRAIGHT_ANGLE
+        lunge_detected = right_leg_angle < LUNGE_BENT_ANGLE
+
+    # STATE TRANSITIONS WITH STRICTER VERIFICATION
+    cooldown_elapsed = current_time - state.last_rep_time > rep_cooldown
+    stage, rep_counted, feedback = lunge_transition(
+        state.stage, standing_detected, lunge_detected, significant_movement, cooldown_elapsed)
+    state.stage = stage
+    rep_counter = state.rep_counter
+    if rep_counted:
+        rep_counter += 1
+        state.rep_counter = rep_counter
+        state.last_rep_time = current_time
+
+    return {
+        'repCounter': rep_counter,
+        'stage': stage,
+        'feedback': feedback,
+        'angles': angles
+    }
 
 
 def process_russian_twist(landmarks, state, current_time, rep_cooldown, hold_threshold):
     """Process landmarks for Russian Twist exercise with improved angle calculation and detection"""
-    try:
-        # Get landmarks for shoulders, hips, and wrists
-        left_shoulder = landmarks[11]
-        right_shoulder = landmarks[12]
-        left_hip = landmarks[23]
-        right_hip = landmarks[24]
-        left_wrist = landmarks[15]
-        right_wrist = landmarks[16]
-        
-        # Initialize variables
-        angles = {}
-        feedback = ""
-        
-        # Initialize tracking state if not exists
-        if 'twist_state' not in state:
-            state['twist_state'] = 'center'
-        if 'twist_direction' not in state:
-            state['twist_direction'] = 'none'
-        if 'left_complete' not in state:
-            state['left_complete'] = False
-        if 'right_complete' not in state:
-            state['right_complete'] = False
-        if 'prev_wrist_x' not in state:
-            state['prev_wrist_x'] = None
-        
-        # Calculate mid points
-        wrist_mid_x = (left_wrist['x'] + right_wrist['x']) / 2
-        shoulder_mid_x = (left_shoulder['x'] + right_shoulder['x']) / 2
-        
-        # Calculate wrist distance from center (how far left/right the hands are)
-        # Normalize by shoulder width to account for different distances from camera
-        shoulder_width = abs(right_shoulder['x'] - left_shoulder['x'])
-        if shoulder_width > 0:
-            relative_wrist_position = (wrist_mid_x - shoulder_mid_x) / shoulder_width
-        else:
-            relative_wrist_position = 0
-            
-        # Store position for visualization
-        angles['WristPos'] = {
-            'value': relative_wrist_position * 100,  # Scale for display
-            'position': {
-                'x': wrist_mid_x,
-                'y': (left_wrist['y'] + right_wrist['y']) / 2 - 0.05
-            }
+    # Get landmarks for shoulders, hips, and wrists
+    left_shoulder, right_shoulder, left_hip, right_hip, left_wrist, right_wrist = TWIST_POINTS(landmarks)
+
+    # Shoulders and wrists are read unconditionally below, so check them once up front
+    if not (has_xy(left_shoulder) and has_xy(right_shoulder) and has_xy(left_wrist) and has_xy(right_wrist)):
+        return {
+            'repCounter': state.rep_counter,
+            'stage': state.twist_state,
+            'feedback': "Position not clear - adjust camera",
+            'angles': {}
         }
+    
+    # Initialize variables
+    angles = {}
+    feedback = ""
+    
+    # Calculate mid points
+    wrist_mid_x = (left_wrist['x'] + right_wrist['x']) * 0.5
+    shoulder_mid_x = (left_shoulder['x'] + right_shoulder['x']) * 0.5
+    
+    # Calculate wrist distance from center (how far left/right the hands are)
+    # Normalize by shoulder width to account for different distances from camera
+    shoulder_width = abs(right_shoulder['x'] - left_shoulder['x'])
+    if shoulder_width > 0.0:
+        relative_wrist_position = (wrist_mid_x - shoulder_mid_x) / shoulder_width
+    else:
+        relative_wrist_position = 0
         
-        # Set thresholds for twist detection
-        left_threshold = -0.5  # Hands are significantly to the left
-        right_threshold = 0.5  # Hands are significantly to the right
-        center_range = 0.2     # Considered center when within this range of 0
-        
-        # Previous state
-        prev_state = state['twist_state']
-        
-        # Detect twist state based on wrist position
-        if relative_wrist_position < left_threshold:
-            current_state = 'left'
-        elif relative_wrist_position > right_threshold:
-            current_state = 'right'
-        elif abs(relative_wrist_position) < center_range:
-            current_state = 'center'
-        else:
-            current_state = prev_state  # Maintain previous state if in transition
-        
-        # State transition logic
-        if prev_state != current_state:
-            # Track when a full side twist is completed
-            if prev_state == 'left' and (current_state == 'center' or current_state == 'right'):
-                state['left_complete'] = True
-                feedback = "Left twist complete"
-            elif prev_state == 'right' and (current_state == 'center' or current_state == 'left'):
-                state['right_complete'] = True
-                feedback = "Right twist complete"
-                
-            # Update state
-            state['twist_state'] = current_state
+    # Store position for visualization
+    angles['WristPos'] = (relative_wrist_position * 100, wrist_mid_x, (left_wrist['y'] + right_wrist['y']) * 0.5 - 0.05)  # Scale for display
+    
+    # Set thresholds for twist detection
+    left_threshold = -0.5  # Hands are significantly to the left
+    right_threshold = 0.5  # Hands are significantly to the right
+    center_range = 0.2     # Considered center when within this range of 0
+    
+    # Previous state
+    prev_state = state.twist_state
+    
+    # Detect twist state based on wrist position
+    if relative_wrist_position < left_threshold:
+        current_state = 'left'
+    elif relative_wrist_position > right_threshold:
+        current_state = 'right'
+    elif abs(relative_wrist_position) < center_range:
+        current_state = 'center'
+    else:
+        current_state = prev_state  # Maintain previous state if in transition
+    
+    # State transition logic
+    if prev_state != current_state:
+        # Track when a full side twist is completed
+        if prev_state == 'left' and (current_state == 'center' or current_state == 'right'):
+            state.left_complete = True
+            feedback = "Left twist complete"
+        elif prev_state == 'right' and (current_state == 'center' or current_state == 'left'):
+            state.right_complete = True
+            feedback = "Right twist complete"
             
-            # Add direction feedback
-            if current_state == 'left':
-                feedback = "Twisting left"
-            elif current_state == 'right':
-                feedback = "Twisting right"
-            elif current_state == 'center':
-                feedback = "Returned to center"
+        # Update state
+        state.twist_state = current_state
         
-        # Count a rep when both left and right twists are completed
-        if state['left_complete'] and state['right_complete']:
-            if current_time - state['lastRepTime'] > rep_cooldown:
-                state['repCounter'] += 1
-                state['lastRepTime'] = current_time
-                feedback = f"Rep {state['repCounter']} complete!"
-                
-                # Reset for next rep
-                state['left_complete'] = False
-                state['right_complete'] = False
-        
-        # Add completion indicators
-        angles['LeftDone'] = {
-            'value': 1 if state['left_complete'] else 0,
-            'position': {
-                'x': left_shoulder['x'] - 0.1,
-                'y': left_shoulder['y'] - 0.1
-            }
-        }
-        
-        angles['RightDone'] = {
-            'value': 1 if state['right_complete'] else 0,
-            'position': {
-                'x': right_shoulder['x'] + 0.1,
-                'y': right_shoulder['y'] - 0.1
-            }
-        }
-        
-        # Store current wrist position for next comparison
-        state['prev_wrist_x'] = wrist_mid_x
-        
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state['twist_state'],
-            'feedback': feedback,
-            'angles': angles
-        }
-        
-    except Exception as e:
-        print(f"Error in Russian Twist detection: {str(e)}")
-        return {
-            'repCounter': state['repCounter'],
-            'stage': state.get('twist_state', 'center'),
-            'feedback': f"Error: {str(e)}",
-            'angles': {}
-        }
+        # Add direction feedback
+        if current_state == 'left':
+            feedback = "Twisting left"
+        elif current_state == 'right':
+            feedback = "Twisting right"
+        elif current_state == 'center':
+            feedback = "Returned to center"
+    
+    # Count a rep when both left and right twists are completed
+    if state.left_complete and state.right_complete:
+        if current_time - state.last_rep_time > rep_cooldown:
+            state.rep_counter += 1
+            state.last_rep_time = current_time
+            feedback = f"Rep {state.rep_counter} complete!"
+            
+            # Reset for next rep
+            state.left_complete = False
+            state.right_complete = False
+    
+    # Add completion indicators
+    angles['LeftDone'] = (1 if state.left_complete else 0, left_shoulder['x'] - 0.1, left_shoulder['y'] - 0.1)
+    
+    angles['RightDone'] = (1 if state.right_complete else 0, right_shoulder['x'] + 0.1, right_shoulder['y'] - 0.1)
+    
+    # Store current wrist position for next comparison
+    state.prev_wrist_x = wrist_mid_x
+    
+    return {
+        'repCounter': state.rep_counter,
+        'stage': state.twist_state,
+        'feedback': feedback,
+        'angles': angles
+    }
 
 
+# Detector for each exerciseType the frontend can send
+EXERCISE_HANDLERS = {
+    'bicepCurl': process_bicep_curl,
+    'squat': process_squat,
+    'pushup': process_pushup,
+    'shoulderPress': process_shoulder_press,
+    'tricepExtension': process_tricep_extension,
+    'lunge': process_lunge,
+    'russianTwist': process_russian_twist,
+}
+
 
 # Run the app
 if __name__ == '__main__':
+    # Production runs `gunicorn app:app` with gunicorn.conf.py; running this file directly
+    # serves through the same gevent WSGI server instead of Werkzeug's blocking dev server
+    # unless FLASK_DEV is set for local work
     # Get port from environment variable or use default (8080)
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if os.environ.get('FLASK_DEV'):
+        app.run(host='0.0.0.0', port=port, debug=False)
+    else:
+        from gevent.pywsgi import WSGIServer
+
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
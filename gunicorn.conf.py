@@ -0,0 +1,21 @@
+import os
+
+# Gunicorn picks this file up automatically from the working directory (see Procfile)
+
+# Bind to the port Render provides, matching the fallback used by `python app.py`
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# A single worker process: exercise_states lives in process memory, so extra workers
+# would split one session's rep count across processes. Concurrency comes from gevent
+# greenlets instead, which never switch in the middle of a landmark handler.
+# Scaling out to more workers (or instances) first needs exercise_states moved to a
+# shared store such as Redis; a short-lived per-worker cache in front of it would let
+# two workers count the same rep. WEB_CONCURRENCY is deliberately not honoured here.
+workers = 1
+worker_class = 'gevent'
+worker_connections = 1000
+
+# Clients post a frame at camera rate; keep their connection open between frames
+keepalive = 75
+
+# No response compression: payloads are well under 2 KB, below the gzip break-even point
@@ -37,6 +37,11 @@ class ExerciseCounter {
         this.lastNotificationTime = 0;
         this.notificationThrottleMs = 2000; 
 
+        // Frames captured while a request is in flight wait here and go out as one batch
+        this.pendingFrames = [];
+        this.requestInFlight = false;
+        this.maxPendingFrames = 30;
+
         this.resize_canvas();
         window.addEventListener('resize', this.resize_canvas.bind(this));
 
@@ -59,6 +64,7 @@ class ExerciseCounter {
         this.lastReportedRepCount = 0;
         this.lastReportedExerciseType = this.exerciseSelector.value;
         this.reportedReps.clear(); 
+        this.pendingFrames = [];
         
         if (this.feedbackDisplay) {
             this.feedbackDisplay.innerText = '';
@@ -202,12 +208,51 @@ class ExerciseCounter {
         this.lastLandmarks = JSON.parse(JSON.stringify(landmarks));
     }
 
-    async send_landmarks_to_backend(landmarks) {
+    flatten_landmarks(landmarks) {
+        // Compact wire format understood by the backend: [x0, y0, vis0, x1, y1, vis1, ...]
+        const flat = new Array(landmarks.length * 3);
+        for (let i = 0; i < landmarks.length; i++) {
+            const point = landmarks[i];
+            flat[i * 3] = point.x;
+            flat[i * 3 + 1] = point.y;
+            flat[i * 3 + 2] = point.visibility;
+        }
+        return flat;
+    }
+
+    send_landmarks_to_backend(landmarks) {
+        this.pendingFrames.push({
+            landmarksFlat: this.flatten_landmarks(landmarks),
+            timestamp: Date.now()
+        });
+        // If the backend is unreachable, keep only the most recent second of frames
+        if (this.pendingFrames.length > this.maxPendingFrames) {
+            this.pendingFrames.shift();
+        }
+
+        if (!this.requestInFlight) {
+            this.flush_pending_frames();
+        }
+    }
+
+    async flush_pending_frames() {
+        // One request at a time, so frames reach the backend in order
+        this.requestInFlight = true;
+        while (this.pendingFrames.length > 0) {
+            const frames = this.pendingFrames;
+            this.pendingFrames = [];
+            await this.post_frames(frames);
+        }
+        this.requestInFlight = false;
+    }
+
+    async post_frames(frames) {
         try {
             const data = {
-                landmarks: landmarks,
+                frames: frames,
                 exerciseType: this.exerciseSelector.value,
-                sessionId: this.sessionId
+                sessionId: this.sessionId,
+                angleFormat: 'columns'
             };
 
             const response = await fetch(`${this.backendUrl}/process_landmarks`, {
@@ -288,12 +333,14 @@ class ExerciseCounter {
         this.ctx.font = "bold 16px Arial";
         this.ctx.lineWidth = 3;
         
-        for (const [key, data] of Object.entries(angles)) {
-            if (data.position && data.value !== undefined) {
-                const x = data.position.x * this.canvas.width;
-                const y = data.position.y * this.canvas.height;
+        // Columnar layout: parallel names / values / [x, y] positions
+        const { names, values, positions } = angles;
+        for (let i = 0; i < names.length; i++) {
+            if (positions[i] && values[i] !== undefined) {
+                const x = positions[i][0] * this.canvas.width;
+                const y = positions[i][1] * this.canvas.height;
                 
-                const text = `${key}: ${Math.round(data.value)}°`;
+                const text = `${names[i]}: ${Math.round(values[i])}°`;
                 const textWidth = this.ctx.measureText(text).width;
                 
                 this.ctx.fillStyle = "rgba(0, 0, 0, 0.5)";